@@ -1,9 +1,17 @@
 
 from .log_levels import INFO
 
-import argparse, os
+import argparse, os, sys
 
 def host(args):
+    server = args.pop('server')
+    if server == 'gevent':
+        from gevent import monkey
+        if not monkey.is_module_patched('socket'):
+            # Sockets etc must be patched before anything that uses them is imported, but this package (and with it
+            # requests, urllib3, ssl, etc) has already been imported by now. Relaunch under gevent's patching launcher.
+            os.execv(sys.executable, [sys.executable, '-m', 'gevent.monkey', '--module', 'as_models'] + sys.argv[1:])
+
     from .web_api import app
 
     app.config['model_path'] = args.pop('model')
@@ -12,7 +20,14 @@ def host(args):
     host = os.environ.get('MODEL_HOST', '0.0.0.0')
     port = int(args.pop('port', os.environ.get('MODEL_PORT', 8080)))
 
-    app.run(host=host, port=port)
+    if server == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer((host, port), app).serve_forever()
+    elif server == 'waitress':
+        from waitress import serve
+        serve(app, host=host, port=port)
+    else:
+        app.run(host=host, port=port)
 
 # Create main arg parser.
 parser = argparse.ArgumentParser(description='Analysis Services Model Integration Engine')
@@ -26,6 +41,8 @@ install_model_parser.add_argument('-t', '--type', help='The model type.', defaul
 install_model_parser.add_argument('-r', '--root', help='The model "root" directory.', default=argparse.SUPPRESS)
 install_model_parser.add_argument('-d', '--debug', help='Run the model in debug mode?', action='store_true')
 install_model_parser.add_argument('-l', '--log-level', help='Default log level (when not overridden on per-job basis).', default=INFO)
+install_model_parser.add_argument('-i', '--in-process', help='Run the model on a thread of the web api process, rather than in a subprocess. Only suitable for models that release the GIL while working.', action='store_true')
+install_model_parser.add_argument('-s', '--server', help='The web server to host the web api with.', choices=('flask', 'gevent', 'waitress'), default='flask', type=str.lower)
 install_model_parser.set_defaults(func=host)
 
 # TODO: install, validate, package commands?
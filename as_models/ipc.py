@@ -0,0 +1,279 @@
+
+from abc import ABC, abstractmethod
+import multiprocessing
+import os
+import queue
+import select
+import struct
+import threading
+import time
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8
+
+DEFAULT_RING_SIZE = 1024 * 1024  # bytes
+
+_FRAME_HEADER = struct.Struct('<I')
+
+_PIPE_READ_SIZE = 65536  # bytes
+
+
+def open_channel(ring_size=DEFAULT_RING_SIZE, ctx=multiprocessing):
+    """
+    Create a one-way channel for passing messages (as bytes) from a job process to the web API.
+
+    :param ring_size: The size of the shared memory ring buffer backing the channel, in bytes.
+    :param ctx: The multiprocessing context the job process will be started from.
+    :return: A (receiver, sender) tuple. Both support the subset of the multiprocessing.Connection interface used by the
+    web API (send_bytes(), recv_bytes_into(), poll() and close()).
+    """
+    if shared_memory is None:
+        # Raw pipe file descriptors are only inherited by forked job processes.
+        if os.name == 'posix' and ctx.get_start_method() == 'fork':
+            channel = PipeChannel()
+            return channel, channel
+
+        return ctx.Pipe(False)
+
+    channel = RingBufferChannel(ring_size, ctx)
+    return channel, channel
+
+
+def open_local_channel():
+    """
+    Create a one-way channel for passing messages (as bytes) from a job run in-process to the web API.
+
+    :return: A (receiver, sender) tuple, supporting the same interface as the channels returned by open_channel().
+    """
+    channel = QueueChannel()
+    return channel, channel
+
+
+class QueueChannel(object):
+    """
+    A message channel between threads of a single process, backed by a queue.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._next = None
+
+    def send_bytes(self, data):
+        self._queue.put(data)
+
+    def poll(self, timeout=0.0):
+        if self._next is None:
+            try:
+                self._next = self._queue.get(timeout is None or timeout > 0, timeout)
+            except queue.Empty:
+                return False
+
+        return True
+
+    def recv_bytes_into(self, buffer):
+        self.poll(None)
+
+        message, self._next = self._next, None
+        if len(message) > len(buffer):
+            raise multiprocessing.BufferTooShort(message)
+
+        buffer[:len(message)] = message
+        return len(message)
+
+    def close(self):
+        pass
+
+
+class _FramedChannel(ABC):
+    """
+    Base class for channels that carry messages as length-prefixed frames over a byte stream. Subclasses append received
+    bytes to self._pending, and implement poll() to return once a whole frame is available.
+    """
+
+    @abstractmethod
+    def poll(self, timeout=0.0):
+        pass
+
+    def recv_bytes_into(self, buffer):
+        self.poll(None)
+
+        size, = _FRAME_HEADER.unpack_from(self._pending)
+        start, end = _FRAME_HEADER.size, _FRAME_HEADER.size + size
+
+        if size > len(buffer):
+            message = bytes(self._pending[start:end])
+            del self._pending[:end]
+            raise multiprocessing.BufferTooShort(message)
+
+        with memoryview(self._pending) as pending:
+            buffer[:size] = pending[start:end]
+        del self._pending[:end]
+
+        return size
+
+    def _frame_available(self):
+        if len(self._pending) < _FRAME_HEADER.size:
+            return False
+
+        size, = _FRAME_HEADER.unpack_from(self._pending)
+        return len(self._pending) >= _FRAME_HEADER.size + size
+
+
+class PipeChannel(_FramedChannel):
+    """
+    A message channel backed by a raw OS pipe, avoiding the overhead of multiprocessing.Connection. Used where shared
+    memory is unavailable.
+    """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self._write_lock = threading.Lock()  # Serialises writers, so their frames aren't interleaved.
+
+        self._pending = bytearray()
+
+    def send_bytes(self, data):
+        frame = _FRAME_HEADER.pack(len(data)) + data
+
+        with self._write_lock, memoryview(frame) as view:
+            while view:
+                view = view[os.write(self._write_fd, view):]
+
+    def poll(self, timeout=0.0):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not self._frame_available():
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            readable, _, _ = select.select([self._read_fd], [], [], remaining)
+            if not readable:
+                return False
+
+            data = os.read(self._read_fd, _PIPE_READ_SIZE)
+            if not data:
+                raise EOFError()
+            self._pending += data
+
+        return True
+
+    def close(self):
+        for fd in (self._read_fd, self._write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass  # Already closed.
+
+
+class RingBufferChannel(_FramedChannel):
+    """
+    A message channel backed by a circular buffer in shared memory, avoiding a socket write and read for every message.
+
+    Messages are written as length-prefixed frames. Writers block while the ring is full. The reader drains whatever
+    bytes are available into a private buffer and extracts frames from that, so messages larger than the ring are still
+    delivered - they just take more than one pass.
+
+    NOTE: no lock is shared between the processes, as one left held by a job process that was killed would block the
+    web API forever. Instead, only the writer ever advances the head and only the reader ever advances the tail, and
+    each posts a semaphore (never held, only posted and waited on) to wake the other after doing so.
+    """
+
+    def __init__(self, size=DEFAULT_RING_SIZE, ctx=multiprocessing):
+        self._memory = shared_memory.SharedMemory(create=True, size=size)
+        self._size = size
+        self._head = ctx.RawValue('Q', 0)  # Total bytes ever written. Only advanced by the writer.
+        self._tail = ctx.RawValue('Q', 0)  # Total bytes ever read. Only advanced by the reader.
+        self._written = ctx.Semaphore(0)  # Posted by the writer whenever the head moves.
+        self._read = ctx.Semaphore(0)  # Posted by the reader whenever the tail moves.
+
+        self._owner = True
+        self._pending = bytearray()
+        self._write_lock = threading.Lock()  # Serialises writer threads, so their frames aren't interleaved.
+        self._read_lock = threading.RLock()  # Serialises reader threads' access to the tail and self._pending.
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_pending', '_write_lock', '_read_lock'):
+            del state[name]
+        state['_owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pending = bytearray()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.RLock()
+
+    def send_bytes(self, data):
+        with self._write_lock:
+            self._write(_FRAME_HEADER.pack(len(data)))
+            self._write(data)
+
+    def poll(self, timeout=0.0):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            with self._read_lock:
+                if self._frame_available() or (self._drain() and self._frame_available()):
+                    return True
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+
+            self._written.acquire(True, remaining)
+
+    def recv_bytes_into(self, buffer):
+        with self._read_lock:
+            return super(RingBufferChannel, self).recv_bytes_into(buffer)
+
+    def close(self):
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+            self._owner = False
+
+    def _write(self, data):
+        # NOTE: caller must hold self._write_lock.
+        with memoryview(data) as view:
+            while view:
+                head = self._head.value
+                count = min(len(view), self._size - (head - self._tail.value))
+                if not count:
+                    self._read.acquire()  # Wait for the reader to make room.
+                    continue
+
+                self._copy_in(head % self._size, view[:count])
+                self._head.value = head + count
+                _post(self._written)
+
+                view = view[count:]
+
+    def _copy_in(self, offset, view):
+        buf = self._memory.buf
+        first = min(len(view), self._size - offset)
+        buf[offset:offset + first] = view[:first]
+        buf[:len(view) - first] = view[first:]
+
+    def _drain(self):
+        # NOTE: caller must hold self._read_lock.
+        head, tail = self._head.value, self._tail.value
+        if head == tail:
+            return False
+
+        buf = self._memory.buf
+        offset, count = tail % self._size, head - tail
+        first = min(count, self._size - offset)
+        self._pending += buf[offset:offset + first]
+        self._pending += buf[:count - first]
+
+        self._tail.value = head
+        _post(self._read)
+
+        return True
+
+
+def _post(semaphore):
+    # Only whether the semaphore has been posted since the other side last waited matters, so its count is kept to at
+    # most one (rather than growing towards its platform-specific limit). NOTE: only one side ever posts each semaphore.
+    semaphore.acquire(False)
+    semaphore.release()
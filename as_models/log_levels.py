@@ -15,23 +15,21 @@ STDERR = 'STDERR'
 
 LEVELS = (DEBUG, INFO, WARNING, ERROR, CRITICAL, STDOUT, STDERR)
 
+_FROM_STDLIB_LEVELNO = {
+    logging.DEBUG: DEBUG,
+    logging.INFO: INFO,
+    logging.WARNING: WARNING,
+    logging.ERROR: ERROR,
+    logging.CRITICAL: CRITICAL
+}
+
+_TO_STDLIB_LEVELNO = {level: levelno for levelno, level in _FROM_STDLIB_LEVELNO.items()}
+
 def from_stdlib_levelno(level, default=None):
-    return {
-        logging.DEBUG: DEBUG,
-        logging.INFO: INFO,
-        logging.WARNING: WARNING,
-        logging.ERROR: ERROR,
-        logging.CRITICAL: CRITICAL
-    }.get(level, default)
+    return _FROM_STDLIB_LEVELNO.get(level, default)
 
 def to_stdlib_levelno(level, default=None):
-    return {
-        DEBUG: logging.DEBUG,
-        INFO: logging.INFO,
-        WARNING: logging.WARNING,
-        ERROR: logging.ERROR,
-        CRITICAL: logging.CRITICAL
-    }.get(level, default)
+    return _TO_STDLIB_LEVELNO.get(level, default)
 
 def compare(level0, level1):
     return LEVELS.index(level0) - LEVELS.index(level1)
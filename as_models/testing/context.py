@@ -51,6 +51,7 @@ class Context(BaseContext):
 
         self._modified_streams = set()
         self._modified_documents = {}
+        self._last_modified_streams = None
 
         self._sensor_config = self._analysis_config = self._thredds_config = self._thredds_upload_config = None
         self._sensor_client = self._analysis_client = self._thredds_client = self._thredds_upload_client = None
@@ -175,11 +176,18 @@ class Context(BaseContext):
         if thredds_upload_path:
             self.configure_thredds_upload_client(url, scheme, host, thredds_upload_path, port, username, password, api_key, verify)
 
-    def update(self, message=None, progress=None, modified_streams=[], modified_documents={}):
+    def update(self, message=None, progress=None, modified_streams=None, modified_documents=None):
         # TODO: figure out a good way of handling the "message" and "progress" parameters
 
-        self._modified_streams.update(modified_streams)
-        self._modified_documents.update(modified_documents)
+        # Models that update per observation tend to report the same streams every time. Skip re-adding them if so.
+        if modified_streams is not None:
+            modified_streams = tuple(modified_streams)
+            if modified_streams != self._last_modified_streams:
+                self._modified_streams.update(modified_streams)
+                self._last_modified_streams = modified_streams
+
+        if modified_documents:
+            self._modified_documents.update(modified_documents)
 
     @property
     def modified_streams(self):
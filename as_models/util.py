@@ -23,6 +23,8 @@ RETRY_STRATEGY = Retry(
 )
 HTTP_ADAPTER = HTTPAdapter(max_retries=RETRY_STRATEGY)
 
+_JSON_SCALAR_TYPES = (str, int, float, bool, type(None))
+
 
 def resolve_service_config(url='', scheme=None, host=None, api_root=None, port=None, username=None, password=None, api_key=None, apiRoot=None, apiKey=None, verify=True):
     api_root = api_root or apiRoot
@@ -105,6 +107,24 @@ def sanitize_dict_for_json(mapping):
     return json.loads(json_data)
 
 
+def maybe_sanitize_dict_for_json(mapping):
+    """
+    Equivalent to sanitize_dict_for_json, but skips the serialisation round trip when 'mapping' is None or a flat dict
+    of str keys to JSON scalar values that is within the size limit. In that case 'mapping' itself is returned.
+
+    :param mapping: dict: a dict of str: object mappings.
+    :return: dict, potentially changed.
+    """
+    if mapping is None:
+        return None
+
+    if type(mapping) is dict and all(type(k) is str and type(v) in _JSON_SCALAR_TYPES for k, v in mapping.items()):
+        if len(json.dumps(mapping)) <= MAX_ERR_DATA_LEN:
+            return mapping
+
+    return sanitize_dict_for_json(mapping)
+
+
 def urljoin(base_url, *paths):
     url_parts = list(urlparse.urlparse(base_url))
     url_parts[2] = posixpath.join(url_parts[2], *paths)  # NOTE: url_parts[2] is path
@@ -1,21 +1,29 @@
 
 from __future__ import print_function
 
-import copy
+import _thread
+import atexit
+import collections
+import ctypes
 import datetime
+import functools
+import json
 import logging
 import multiprocessing
 import os
+import pickle
 import signal
 import sys
+import threading
 import time
 import traceback
 from flask import Flask, jsonify, make_response, request
+from flask.json.provider import DefaultJSONProvider
 import warnings
 
 from werkzeug.exceptions import InternalServerError
 
-from . import log_levels
+from . import ipc, log_levels
 from .exceptions import SenapsModelError
 from .manifest import Manifest
 from .model_state import PENDING, RUNNING, COMPLETE, TERMINATED, FAILED
@@ -24,9 +32,14 @@ from .runtime.python import PythonModelRuntime
 from .runtime.r import RModelRuntime
 from .sentinel import Sentinel
 from .stats import get_peak_memory_usage
-from .util import sanitize_dict_for_json
+from .util import maybe_sanitize_dict_for_json
 from .version import __version__
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional - fall back to the stdlib JSON parser.
+
 _SENTINEL = Sentinel()
 _SUBPROCESS_STARTUP_TIME_LIMIT = 30.0  # seconds
 
@@ -34,22 +47,132 @@ _SUBPROCESS_STARTUP_TIME_LIMIT = 30.0  # seconds
 # last-minute status updates to be pulled off the IPC pipe.
 _MODEL_RESOLUTION_GRACE_PERIOD_SEC = 5.0
 
-# If model terminates prematurely, limit how long we'll wait for process cleanup.
-_ABNORMAL_TERMINATION_TIMEOUT_SEC = 5.0  # seconds
+# How long to wait for the model to terminate when cleaning up after an internal error.
+_INTERNAL_ERROR_TERMINATION_TIMEOUT_SEC = 5.0  # seconds
+
+# Log entries are queued by the job process and sent to the web API in batches, at least this often...
+_FLUSH_INTERVAL_SEC = 0.05
+# ... or as soon as this many entries are queued.
+_LOG_BATCH_SIZE = 256
+
+# Progress-only updates are held back (until the next flush) if they follow the last progress sent by less than both of
+# these thresholds.
+_PROGRESS_COALESCE_INTERVAL_SEC = 0.02
+_PROGRESS_COALESCE_DELTA = 0.001
+
+# Each message sent over the IPC channel is a single byte identifying its kind, followed by its pickled payload.
+_LOG_ENTRIES = b'\x01'  # Payload is a list of log entries.
+_STATE_UPDATE = b'\x02'  # Payload is a dict of updated state properties.
+
+# How long the background receiver waits for a message before checking whether it has been stopped...
+_RECEIVE_POLL_INTERVAL_SEC = 0.05
+# ... and how long it's given to stop before the channel is closed regardless.
+_RECEIVER_STOP_TIMEOUT_SEC = 1.0
+
+# How often a request waiting for the model to finish re-checks for startup timeouts and premature termination.
+_WAIT_POLL_INTERVAL_SEC = 0.1
+
+# Initial size of the buffer that status updates are read into from the IPC pipe. Grown on demand if a larger update is
+# received.
+_RECEIVE_BUFFER_SIZE = 65536  # bytes
+
+# Maximum number of log entries buffered between status requests. If more than this many are logged before the next
+# request, the oldest are discarded.
+_MAX_BUFFERED_LOG_ENTRIES = 10000
+
+# Job subprocesses are started with the platform's default method, shared by the job process and its IPC channel. Where
+# that default is fork, the job inherits the web API's already-imported modules. NOTE: forking a process that's running
+# other threads (server workers, the receiver) is unsafe in general, since the child may inherit a lock one of them
+# held. That's accepted only where fork is already the default, because the model API has always run that way there;
+# elsewhere (e.g. macOS) the safer default is kept. To limit the risk, the job process avoids the web API's own locks:
+# it replaces the inherited log handlers (which take the API state's lock) with its own, and Python re-creates the
+# logging module's locks after a fork.
+_JOB_CONTEXT = multiprocessing.get_context()
+
+# Pre-serialised bodies for error responses that don't vary between requests.
+_MISSING_MODEL_ID_ERROR = json.dumps({'error': 'Required property "modelId" is missing.'}).encode('utf-8')
+
+# Log level lookup tables, bound locally since they're consulted for every log record.
+_FROM_STDLIB_LEVELNO = log_levels._FROM_STDLIB_LEVELNO
+_TO_STDLIB_LEVELNO = log_levels._TO_STDLIB_LEVELNO
+_SUPPORTED_LEVELS = frozenset(log_levels.LEVELS)
 
 
 logging.captureWarnings(True)
 
+# The most recently formatted whole-second timestamp, as a (seconds, formatted) tuple. Log records typically arrive many
+# to the second, so this saves a gmtime() and strftime() for most of them.
+_timestamp_cache = (None, None)
+
 
 def _signalterm_handler(signum, stack):
     exit(0)
 
 
+def _format_timestamp(record):
+    global _timestamp_cache
+
+    seconds, formatted = _timestamp_cache
+    if int(record.created) != seconds:
+        seconds = int(record.created)
+        formatted = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        _timestamp_cache = (seconds, formatted)
+
+    return f'{formatted}.{int(record.msecs) % 1000:03}Z'
+
+
+def _is_gevent_patched():
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    return (gevent_monkey is not None) and gevent_monkey.is_module_patched('threading')
+
+
+def _get_native_thread_function(name):
+    """
+    Get a function of the _thread module as it was before any monkey-patching by gevent.
+
+    :param name: str: the function's name, e.g. 'start_new_thread'.
+    :return: the native function.
+    """
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is None:
+        return getattr(_thread, name)
+
+    return gevent_monkey.get_original('_thread', name)
+
+
+def _new_log_buffer():
+    return collections.deque(maxlen=_MAX_BUFFERED_LOG_ENTRIES)
+
+
+def _get_log_buffer(state):
+    try:
+        return state['log']
+    except KeyError:
+        log = state['log'] = _new_log_buffer()
+        return log
+
+
+def _send(sender, kind, payload):
+    sender.send_bytes(kind + pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+
 class _Updater(object):
-    def __init__(self, sender):
+    __slots__ = ('_sender', '_state', '_log_queue', '_send_lock', '_progress_pending', '_sent_progress',
+                 '_progress_sent_at', '_min_levelno')
+
+    def __init__(self, sender, native=False):
         self._sender = sender
 
         self._state = {}
+        self._log_queue = collections.deque()
+        # NOTE: a native lock is needed to guard against a native _UpdateFlusher (_thread's RLock is never patched).
+        self._send_lock = _thread.RLock() if native else threading.RLock()
+
+        self._progress_pending = False
+        self._sent_progress = None
+        self._progress_sent_at = float('-inf')
+
+        self._min_levelno = logging.NOTSET
 
     def update(self, message=_SENTINEL, progress=_SENTINEL, modified_streams=None, modified_documents=None):
         if modified_streams is not None:
@@ -59,21 +182,36 @@ class _Updater(object):
             warnings.warn('Usage of modified_documents argument is deprecated and will be removed in a future version',
                           DeprecationWarning)
 
-        update = {k: v for k, v in {
-            'state': RUNNING,
-            'message': message,
-            'progress': progress
-        }.items() if v not in (_SENTINEL, self._state.get(k, _SENTINEL))}
+        state = self._state
+        update = {}
+        if state.get('state') != RUNNING:
+            update['state'] = RUNNING
+        if message is not _SENTINEL and message != state.get('message', _SENTINEL):
+            update['message'] = message
+        if progress is not _SENTINEL and progress != state.get('progress', _SENTINEL):
+            update['progress'] = progress
 
-        if update:
-            self._state.update(update)
-            self._sender.send(update)
+        if not update:
+            return
+
+        self._state.update(update)
+
+        if (update.keys() == {'progress'}) and self._can_defer_progress(progress):
+            self._progress_pending = True
+        else:
+            self.send(update)
 
     def log(self, message, level=None, file=None, line=None, timestamp=None, logger_=None):
-        if level is not None and level not in log_levels.LEVELS:
+        if level is not None and level not in _SUPPORTED_LEVELS:
             raise ValueError(
                 'Unsupported log level "{}". Supported values: {}'.format(level, ', '.join(log_levels.LEVELS)))
 
+        # Entries below the job's log level are dropped before any work is done on them. NOTE: records from the logging
+        # module have already been filtered by the root logger, but models (e.g. R models) may call log() directly.
+        # STDOUT and STDERR aren't part of the level hierarchy, so are never dropped.
+        if _TO_STDLIB_LEVELNO.get(level, logging.CRITICAL) < self._min_levelno:
+            return
+
         message = message.rstrip() if message else None
 
         if not message:
@@ -91,54 +229,199 @@ class _Updater(object):
             'logger': logger_
         }
 
-        self._sender.send({'log': [log_entry]})
+        log_queue = self._log_queue
+        log_queue.append(log_entry)
+
+        if len(log_queue) >= _LOG_BATCH_SIZE:
+            self.flush()
+
+    def set_log_level(self, levelno):
+        self._min_levelno = levelno or logging.NOTSET
+
+    def send(self, update):
+        with self._send_lock:
+            # Send any queued log entries first, so they aren't reordered with respect to the update.
+            self._flush_logs()
+
+            if self._progress_pending and 'progress' not in update:
+                update = dict(update, progress=self._state['progress'])
+            self._send_state(update)
+
+    def flush(self):
+        with self._send_lock:
+            self._flush_logs()
+
+            if self._progress_pending:
+                self._send_state({'progress': self._state['progress']})
+
+    def _can_defer_progress(self, progress):
+        if (time.monotonic() - self._progress_sent_at) >= _PROGRESS_COALESCE_INTERVAL_SEC:
+            return False
+
+        try:
+            return abs(progress - self._sent_progress) < _PROGRESS_COALESCE_DELTA
+        except TypeError:
+            return False
+
+    def _send_state(self, update):
+        # NOTE: caller must hold self._send_lock.
+        if 'progress' in update:
+            self._progress_pending = False
+            self._sent_progress = update['progress']
+            self._progress_sent_at = time.monotonic()
+
+        _send(self._sender, _STATE_UPDATE, update)
+
+    def _flush_logs(self):
+        # NOTE: caller must hold self._send_lock.
+        while self._log_queue:
+            batch = [self._log_queue.popleft() for _ in range(min(len(self._log_queue), _LOG_BATCH_SIZE))]
+            _send(self._sender, _LOG_ENTRIES, batch)
+
+
+class _UpdateFlusher(object):
+    """
+    Flushes a job's queued updates periodically, from a background thread.
+
+    NOTE: a job process forked from a web API hosted with gevent inherits its monkey-patched threading, under which a
+    background "thread" is a greenlet that never gets to run while the model computes. So job processes run the
+    flusher on a native thread.
+    """
+
+    def __init__(self, updater, native=False):
+        self._updater = updater
+
+        if native:
+            self._start_new_thread = _get_native_thread_function('start_new_thread')
+            allocate_lock = _get_native_thread_function('allocate_lock')
+        else:
+            self._start_new_thread, allocate_lock = _thread.start_new_thread, _thread.allocate_lock
+
+        # Both held until released to signal the event.
+        self._stopped, self._finished = allocate_lock(), allocate_lock()
+        self._stopped.acquire()
+        self._finished.acquire()
+
+    def start(self):
+        self._start_new_thread(self._run, ())
+
+    def stop(self):
+        self._stopped.release()
+        self._finished.acquire()
+
+    def _run(self):
+        try:
+            while not self._stopped.acquire(True, _FLUSH_INTERVAL_SEC):
+                self._updater.flush()
+        finally:
+            self._finished.release()
 
 
 class _JobProcessLogHandler(logging.Handler):
+    __slots__ = ('_updater',)
+
     def __init__(self, updater):
         super(_JobProcessLogHandler, self).__init__(logging.NOTSET)
 
         self._updater = updater
 
-    def emit(self, record):
-        self.format(record)
+    def emit(self, record, _from_stdlib_levelno=_FROM_STDLIB_LEVELNO.get):
         self._updater.log(
-            message=record.message,
-            level=log_levels.from_stdlib_levelno(record.levelno),
+            message=record.getMessage(),
+            level=_from_stdlib_levelno(record.levelno),
             file=record.filename or None,
             line=record.lineno,
-            timestamp=time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03}Z'.format(
-                int(record.msecs) % 1000),
+            timestamp=_format_timestamp(record),
             logger_=record.name
         )
 
 
 class StreamRedirect(object):
+    __slots__ = ('_original_stream', '_updater', '_log_level', '_write', '_log')
+
     def __init__(self, original_stream, updater, log_level):
         self._original_stream = original_stream
         self._updater = updater
         self._log_level = log_level
 
+        # Bound once, as write() is called for every chunk of output.
+        self._write = original_stream.write
+        self._log = updater.log
+
     def write(self, string):
-        self._original_stream.write(string)
-        self._updater.log(string, level=self._log_level)
+        self._write(string)
+        self._log(string, level=self._log_level)
 
     def flush(self):
         self._original_stream.flush()
 
 
+class _ThreadStreamRouter(object):
+    """
+    Stands in for sys.stdout or sys.stderr while jobs run in-process. Output written by a job's thread goes to that
+    job's StreamRedirect; output from any other thread passes straight through to the original stream. Installed once
+    and never removed, as other threads may be writing to it at any time.
+    """
+
+    def __init__(self, original_stream):
+        self.original_stream = original_stream
+        self._redirects = {}  # Thread ident -> StreamRedirect.
+
+    def redirect(self, stream_redirect):
+        self._redirects[threading.get_ident()] = stream_redirect
+
+    def restore(self):
+        self._redirects.pop(threading.get_ident(), None)
+
+    def write(self, string):
+        return self._redirects.get(threading.get_ident(), self.original_stream).write(string)
+
+    def flush(self):
+        self.original_stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original_stream, name)
+
+
+# Every _ThreadStreamRouter ever installed. They're kept referenced so that one replaced in sys (e.g. by a test runner
+# restoring its own streams) is never freed while another thread is still writing to it.
+_stream_routers = []
+_stream_routers_lock = threading.Lock()
+
+
+def _get_stream_router(name):
+    """
+    Get the _ThreadStreamRouter installed as the given sys stream, installing one if necessary.
+
+    :param name: str: 'stdout' or 'stderr'.
+    :return: _ThreadStreamRouter
+    """
+    with _stream_routers_lock:
+        stream = getattr(sys, name)
+        if not isinstance(stream, _ThreadStreamRouter):
+            stream = _ThreadStreamRouter(stream)
+            _stream_routers.append(stream)
+            setattr(sys, name, stream)
+
+        return stream
+
+
 class _JobProcess(object):
-    def __init__(self, model_runtime, args, job_request, sender, logger_):
+    __slots__ = ('_model_runtime', '_args', '_job_request', '_sender', '_logger', '_in_process')
+
+    def __init__(self, model_runtime, args, job_request, sender, logger_, in_process=False):
         self._model_runtime = model_runtime
         self._args = args
         self._job_request = job_request
         self._sender = sender
         self._logger = logger_
+        self._in_process = in_process
 
-    def __post_exception(self, exc, model_id):
+    def __post_exception(self, updater, exc, model_id):
         """
-        Given an exception object, use the _sender to post a dict of results.
+        Given an exception object, use the updater to post a dict of results.
 
+        :param updater: _Updater: the job's updater.
         :param exc: Exception or subclass thereof
         :param model_id: str: model id that raised this exception. May be None.
         :return: None
@@ -150,9 +433,9 @@ class _JobProcess(object):
             # it should only be able to be None if another exception is raised on this thread
             # or someone invoked exc_clear prior to us consuming it.
             developer_msg = ''.join(traceback.format_exception(type(exc), value=exc, tb=tb))
-        user_data = sanitize_dict_for_json(exc.user_data) if type(exc) == SenapsModelError else None
+        user_data = maybe_sanitize_dict_for_json(exc.user_data) if type(exc) == SenapsModelError else None
         msg = exc.msg if type(exc) == SenapsModelError else str(exc)
-        self._sender.send({
+        updater.send({
             'state': FAILED,
             'exception': {  # CPS-889: this format only supported since AS-API v3.9.3
                 'developer_msg': developer_msg,
@@ -164,19 +447,41 @@ class _JobProcess(object):
 
     def __call__(self):
         model_id = None  # pre-declare this so the name exists later if an exception occurs.
-        signal.signal(signal.SIGTERM, _signalterm_handler)
+        if not self._in_process:
+            signal.signal(signal.SIGTERM, _signalterm_handler)
 
-        updater = _Updater(self._sender)
+        updater = _Updater(self._sender, native=not self._in_process)
 
         # Initialise logging.
-        sys.stdout = StreamRedirect(sys.stdout, updater, log_levels.STDOUT)
-        sys.stderr = StreamRedirect(sys.stderr, updater, log_levels.STDERR)
         log_level = self._job_request.get('logLevel', self._args.get('log_level', 'INFO'))
+        levelno = _TO_STDLIB_LEVELNO.get(log_level)
+        updater.set_log_level(levelno)
         root_logger = logging.getLogger()
-        root_logger.addHandler(_JobProcessLogHandler(updater))
-        root_logger.setLevel(log_levels.to_stdlib_levelno(log_level))
+        original_levelno = root_logger.level
+        if self._in_process:
+            # NOTE: the web API's other threads keep running (and writing) alongside the job, so the process-wide
+            # streams are never swapped per job. Only this thread's output is redirected. Log records already reach
+            # the job's state via the _WebAPILogHandler.
+            stdout_router, stderr_router = _get_stream_router('stdout'), _get_stream_router('stderr')
+            stdout_router.redirect(StreamRedirect(stdout_router.original_stream, updater, log_levels.STDOUT))
+            stderr_router.redirect(StreamRedirect(stderr_router.original_stream, updater, log_levels.STDERR))
+        else:
+            # Thread and process details aren't reported, so don't have every LogRecord look them up.
+            logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+            sys.stdout = StreamRedirect(sys.stdout, updater, log_levels.STDOUT)
+            sys.stderr = StreamRedirect(sys.stderr, updater, log_levels.STDERR)
+
+            # Log records are sent to the web API over the channel instead of to any handlers inherited from it (when
+            # forked). NOTE: those take the API state's lock, which another of its threads may have held at the time.
+            for handler in [h for h in root_logger.handlers if isinstance(h, _WebAPILogHandler)]:
+                root_logger.removeHandler(handler)
+            root_logger.addHandler(_JobProcessLogHandler(updater))
+        root_logger.setLevel(levelno)
         process_logger = logging.getLogger('JobProcess')
 
+        update_flusher = _UpdateFlusher(updater, native=not self._in_process)
+        update_flusher.start()
+
         # Run the model!
         try:
             model_id = self._job_request['modelId']
@@ -187,40 +492,112 @@ class _JobProcess(object):
             api_state.model_complete.value = 1
             process_logger.debug('Implementation method for model %s returned.', model_id)
 
-            self._sender.send({
+            updater.send({
                 'state': COMPLETE,
                 'progress': 1.0
             })
         except BaseException as e:
             process_logger.critical('Model failed with exception: %s', e)
 
-            self.__post_exception(e, model_id)
+            self.__post_exception(updater, e, model_id)
+        finally:
+            update_flusher.stop()
+            updater.flush()
+
+            if self._in_process:
+                stdout_router.restore()
+                stderr_router.restore()
+                root_logger.setLevel(original_levelno)
+
+
+class _JobThread(threading.Thread):
+    """
+    Runs a job on a thread of the web API process, for models that don't need the isolation of a subprocess. Provides
+    the subset of the multiprocessing.Process interface used to manage the job.
+    """
+
+    def __init__(self, target):
+        super(_JobThread, self).__init__(target=target, name='JobThread', daemon=True)
+
+    @property
+    def pid(self):
+        return os.getpid()
+
+    @property
+    def exitcode(self):
+        return None
+
+    def terminate(self):
+        # Equivalent to the SIGTERM handler installed in job subprocesses. NOTE: only takes effect once the thread is
+        # next executing Python code.
+        if self.is_alive():
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.ident), ctypes.py_object(SystemExit))
+
+    def kill(self):
+        logger.warning('Unable to forcibly kill a model running in-process.')
 
 
 class _WebAPILogHandler(logging.Handler):
-    def __init__(self, state):
+    __slots__ = ('_state', '_state_lock')
+
+    def __init__(self, state, state_lock):
         super(_WebAPILogHandler, self).__init__(logging.NOTSET)
 
         self._state = state
+        self._state_lock = state_lock
 
-    def emit(self, record):
-        self.format(record)
-
-        self._state.setdefault('log', []).append({
-            'message': record.message,
-            'level': log_levels.from_stdlib_levelno(record.levelno),
+    def emit(self, record, _from_stdlib_levelno=_FROM_STDLIB_LEVELNO.get):
+        entry = {
+            'message': record.getMessage(),
+            'level': _from_stdlib_levelno(record.levelno),
             'file': record.filename or None,
             'lineNumber': record.lineno,
-            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03}Z'.format(
-                int(record.msecs) % 1000),
+            'timestamp': _format_timestamp(record),
             'logger': record.name
-        })
+        }
+
+        # The buffer is swapped out under the lock whenever the state is requested, so look it up under the lock too,
+        # or the entry may be appended to a buffer that has already been sent.
+        with self._state_lock:
+            _get_log_buffer(self._state).append(entry)
+
+
+class _Receiver(threading.Thread):
+    """
+    Applies messages from the job to the API state as they arrive, so that status requests needn't read from the IPC
+    channel themselves.
+    """
+
+    def __init__(self, api_state_):
+        super(_Receiver, self).__init__(name='Receiver', daemon=True)
+
+        self._api_state = api_state_
+        self._stopped = threading.Event()
+
+    def run(self):
+        receiver = self._api_state.receiver
+
+        try:
+            while not self._stopped.is_set():
+                if receiver.poll(_RECEIVE_POLL_INTERVAL_SEC):
+                    with self._api_state.lock:
+                        self._api_state.poll_model_status()
+                        self._api_state.changed.notify_all()
+        except EOFError:
+            pass  # This is "normal", occurs when IPC pipe is closed.
+
+    def stop(self):
+        self._stopped.set()
+        self.join(_RECEIVER_STOP_TIMEOUT_SEC)
 
 
 class ApiState(object):
     def __init__(self):
+        self.lock = threading.RLock()  # Guards the state against concurrent updates from the receiver thread.
+        self.changed = threading.Condition(self.lock)  # Notified whenever the receiver thread updates the state.
         self.process = None
         self.receiver = None
+        self._receiver_thread = None
         self.model_id = None
         self.state = None
         self.model_complete = None
@@ -229,21 +606,45 @@ class ApiState(object):
         self._root_logger = None
         self.stats = None
         self.subprocess_ever_ran = False
+        self._receive_buffer = bytearray(_RECEIVE_BUFFER_SIZE)
 
         self.reset()
 
     def reset(self):
-        self.process = self.receiver = self.model_id = self.started_timestamp = self.resolved_timestamp = None
+        self.close_receiver()
+
+        self.process = self.model_id = self.started_timestamp = self.resolved_timestamp = None
         self.subprocess_ever_ran = False
 
         self.state = {'state': PENDING}
         self.model_complete = multiprocessing.Value('i', 0)
 
         self._root_logger = logging.getLogger()
-        self._root_logger.addHandler(_WebAPILogHandler(self.state))
+        self._root_logger.addHandler(_WebAPILogHandler(self.state, self.lock))
+
+    def close_receiver(self):
+        if self._receiver_thread is not None:
+            self._receiver_thread.stop()
+            self._receiver_thread = None
+
+        if self.receiver is not None:
+            self.receiver.close()
+            self.receiver = None
+
+    def start_receiving(self):
+        # NOTE: under gevent, the receiver would be a greenlet, and waiting on the IPC channel (e.g. the ring buffer's
+        # OS-level semaphore) would block the server's whole event loop. There, the channel is drained on request.
+        if _is_gevent_patched():
+            return
+
+        self._receiver_thread = _Receiver(self)
+        self._receiver_thread.start()
 
     def poll(self):
-        self.poll_model_status()
+        # NOTE: messages from the job are normally applied to the state by the receiver thread, as they arrive.
+        if self._receiver_thread is None:
+            self.poll_model_status()
+
         self.record_statistics()
         self.check_for_startup_timeout()
         self.check_for_subprocess_termination()
@@ -251,12 +652,26 @@ class ApiState(object):
     def poll_model_status(self):
         try:
             while (self.receiver is not None) and self.receiver.poll():
-                update = self.receiver.recv()
-                self.state.setdefault('log', []).extend(update.pop('log', []))
-                self.state.update(update)
+                kind, payload = self._receive()
+                if kind == _LOG_ENTRIES:
+                    _get_log_buffer(self.state).extend(payload)
+                else:
+                    self.state.update(payload)
         except EOFError:
             pass  # This is "normal", occurs when IPC pipe is closed.
 
+    def _receive(self):
+        # Read into a reusable buffer rather than having the pipe allocate a fresh one for every update.
+        try:
+            size = self.receiver.recv_bytes_into(self._receive_buffer)
+        except multiprocessing.BufferTooShort as e:
+            message = e.args[0]
+            self._receive_buffer = bytearray(max(len(message), 2 * len(self._receive_buffer)))
+            return message[:1], pickle.loads(memoryview(message)[1:])
+
+        with memoryview(self._receive_buffer) as view:
+            return bytes(view[:1]), pickle.loads(view[1:size])
+
     def check_for_startup_timeout(self):
         if self.model_state != PENDING:  # We've successfully started up
             return
@@ -279,7 +694,7 @@ class ApiState(object):
             return
 
         # At this point, the subprocess has run at some point but is no longer running. Check for any status updates
-        # queued on the IPC pipe before it died.
+        # queued on the IPC channel before it died, which the receiver thread may not have applied yet.
         self.poll_model_status()
 
         # If final success/failure state reached, we're all good.
@@ -294,11 +709,9 @@ class ApiState(object):
             return  # Grace period not elapsed - don't proceed any further, for now.
 
         # Grace period has elapsed without any final state from the model. This suggests it failed prematurely, possibly
-        # due to a segfault or other such issue. Attempt to clean up.
-        logger.critical('Model terminated prematurely, waiting {} seconds for process cleanup'.format(
-            _ABNORMAL_TERMINATION_TIMEOUT_SEC
-        ))
-        self.process.join(_ABNORMAL_TERMINATION_TIMEOUT_SEC)
+        # due to a segfault or other such issue. The process has already exited (and been reaped by is_alive()), so its
+        # exit code is available without blocking on a join.
+        logger.critical('Model terminated prematurely.')
 
         exit_code = self.process.exitcode
         exit_description = 'unknown exit code' if exit_code is None else 'exit code {}'.format(exit_code)
@@ -325,7 +738,7 @@ class ApiState(object):
         self.state['exception'] = {
             'developer_msg': dev_message,
             'msg': message,
-            'data': sanitize_dict_for_json(data),
+            'data': maybe_sanitize_dict_for_json(data),
             'model_id': self.model_id
         }
 
@@ -358,26 +771,38 @@ class ApiState(object):
         return self.model_state in {COMPLETE, FAILED, TERMINATED}
 
 
+class _OrjsonProvider(DefaultJSONProvider):
+    """
+    Parses request bodies with orjson, which is considerably faster than the stdlib parser for large job requests.
+    Serialisation is left to the default provider, to preserve its handling of non-JSON-native types.
+    """
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = _OrjsonProvider(app)
 
 api_state = ApiState()
+atexit.register(api_state.close_receiver)  # Whichever receiver is current at exit; earlier ones are closed by reset().
 
 logger = logging.getLogger('WebAPI')
 logging.getLogger('werkzeug').setLevel(logging.ERROR)  # disable unwanted Flask HTTP request logs
 
 
 def _get_state():
-    api_state.poll()
+    with api_state.lock:
+        api_state.poll()
 
-    ret_val = copy.deepcopy(api_state.state)
+        ret_val = dict(api_state.state)
 
-    # CPS-952: purge old log messages.
-    if 'log' in api_state.state:
-        purge_count = len(api_state.state['log'])
-        for i in range(purge_count, 0, -1):
-            # count backwards always deleting the 0th item.
-            # allows us to avoid clobbering incoming messages while we work.
-            del api_state.state['log'][0]
+        # CPS-952: purge old log messages. The log buffer is swapped out for a new one rather than copied and cleared,
+        # so each response only costs as much as the messages it contains.
+        if 'log' in api_state.state:
+            log, api_state.state['log'] = api_state.state['log'], _new_log_buffer()
+            ret_val['log'] = list(log)
 
     ret_val['api_version'] = __version__
 
@@ -387,10 +812,7 @@ def _get_state():
     return ret_val
 
 
-def terminate(timeout=0.0):
-    if api_state.process is None:
-        return  # Can't terminate model - it never started.
-
+def _terminate_process(timeout):
     logger.debug('Waiting %.2f seconds for model to terminate.', timeout)
 
     api_state.process.terminate()
@@ -398,13 +820,29 @@ def terminate(timeout=0.0):
 
     if api_state.process.is_alive():
         logger.warning('Model process failed to terminate within timeout. Sending SIGKILL.')
-        os.kill(api_state.process.pid, signal.SIGKILL)
+        api_state.process.kill()
     else:
         logger.debug('Model shut down cleanly.')
 
     if api_state.model_state not in (COMPLETE, FAILED):
         api_state.model_state = TERMINATED
 
+
+def _terminate_in_background(timeout):
+    # noinspection PyBroadException
+    try:
+        _terminate_process(timeout)
+    except Exception:
+        logger.exception('A further error occurred when attempting to terminate the model in response to an internal '
+                         'error.')
+
+
+def terminate(timeout=0.0):
+    if api_state.process is None:
+        return  # Can't terminate model - it never started.
+
+    _terminate_process(timeout)
+
     # Make best-effort attempt to stop the web API.
     func = request.environ.get('werkzeug.server.shutdown')
 
@@ -423,6 +861,9 @@ def _get_traceback(exc):
         pass
 
 
+# NOTE: the model (and therefore its runtime) doesn't change over the lifetime of the web API, so it's only resolved
+# once rather than for every job. Failed resolutions aren't cached.
+@functools.lru_cache(maxsize=None)
 def _load_runtime(model_path, runtime_type=None):
     # Locate manifest, if possible.
     if os.path.isfile(model_path):
@@ -475,7 +916,7 @@ def _post_root():
     try:
         api_state.model_id = job_request['modelId']
     except KeyError:
-        return make_response(jsonify({'error': 'Required property "modelId" is missing.'}), 400)
+        return app.response_class(_MISSING_MODEL_ID_ERROR, status=400, mimetype='application/json')
 
     args = app.config.get('args', {})
     model_runtime = _load_runtime(app.config['model_path'], args.get('type'))
@@ -489,26 +930,53 @@ def _post_root():
     except KeyError:
         return make_response(jsonify({'error': 'Unknown model "{}".'.format(api_state.model_id)}), 500)
 
-    missing_ports = [port.name for port in model.ports if
-                     port.required and (port.name not in job_request.get('ports', {}))]
+    bound_ports = job_request.get('ports', {})
+    missing_ports = [port.name for port in model.ports if port.required and (port.name not in bound_ports)]
 
     if missing_ports:
         logger.warning('Missing bindings for required model port(s): {}'.format(', '.join(missing_ports)))
 
-    api_state.set_log_level(log_levels.to_stdlib_levelno(args.get('log_level', 'INFO')))
+    api_state.set_log_level(_TO_STDLIB_LEVELNO.get(args.get('log_level', 'INFO')))
 
-    api_state.receiver, sender = multiprocessing.Pipe(False)
-    job_process = _JobProcess(model_runtime, args, job_request, sender, logger)
+    in_process = args.get('in_process', False)
+    if in_process:
+        api_state.receiver, sender = ipc.open_local_channel()
+    else:
+        api_state.receiver, sender = ipc.open_channel(ctx=_JOB_CONTEXT)
+    job_process = _JobProcess(model_runtime, args, job_request, sender, logger, in_process)
 
-    try:
-        with multiprocessing.get_context('spawn') as mp:
-            api_state.process = mp.Process(target=job_process)
-    except (AttributeError, ValueError, TypeError):
-        # AttributeError if running pre-3.4 Python (and get_context() is therefore unavailable); ValueError if "spawn"
-        # is unsupported.
-        api_state.process = multiprocessing.Process(target=job_process)
+    if in_process:
+        api_state.process = _JobThread(job_process)
+    else:
+        api_state.process = _JOB_CONTEXT.Process(target=job_process)
 
     api_state.process.start()
+    api_state.start_receiving()
+
+    return _get_root()
+
+
+@app.route('/healthz', methods=['GET'])
+def _get_healthz():
+    # Lightweight readiness probe - unlike GET /, doesn't touch the job's state.
+    return 'ok'
+
+
+@app.route('/wait', methods=['GET'])
+def _get_wait():
+    # Long-polling alternative to GET / - doesn't respond until the model has finished, or the timeout has elapsed.
+    timeout = request.args.get('timeout', 0.0, type=float)
+    deadline = time.monotonic() + timeout
+
+    with api_state.changed:
+        while api_state.process is not None:
+            api_state.poll()
+
+            remaining = deadline - time.monotonic()
+            if api_state.in_resolved_state or remaining <= 0:
+                break
+
+            api_state.changed.wait(min(remaining, _WAIT_POLL_INTERVAL_SEC))
 
     return _get_root()
 
@@ -527,17 +995,14 @@ def _post_terminate():
 def handle_500(e):
     cause = getattr(e, "original_exception", e)
 
-    message = 'An internal error occurred.'
-    dev_message = str(cause)
-    data = {'originalTraceback': _get_traceback(cause)}
-
-    try:
-        terminate(5.0)
-    except Exception as termination_error:
-        message += ' A further error occurred when attempting to terminate the model in response to the first error.'
-        dev_message = 'Original error: ' + dev_message + '\nTermination error: ' + str(termination_error)
-        data['terminationTraceback'] = _get_traceback(termination_error)
+    api_state.fail_with_exception('An internal error occurred.', str(cause), {
+        'originalTraceback': _get_traceback(cause)
+    })
 
-    api_state.fail_with_exception(message, dev_message, data)
+    # Terminate the model on a background thread, so that neither this response nor subsequent status polls are held up
+    # waiting for the model process to exit. Any error doing so is reported via the log.
+    if api_state.process is not None:
+        threading.Thread(target=_terminate_in_background, args=(_INTERNAL_ERROR_TERMINATION_TIMEOUT_SEC,),
+                         daemon=True).start()
 
     return make_response(_get_root(), 500)
@@ -31,10 +31,15 @@ setup(
         'httpretty==1.1.4',
         'webob==1.8.7',
         'xarray==0.18.0',
-        'rpy2==3.3.3'
+        'rpy2==3.3.3',
+        'pytest',
+        'pytest-xdist'
     ],
     extras_require={
         'r': ['rpy2==3.3.3'],
+        'gevent': ['gevent'],
+        'orjson': ['orjson'],
+        'waitress': ['waitress'],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import unittest
+
+from as_models.ipc import PipeChannel, open_channel, open_local_channel
+
+
+def _send_messages(sender, count):
+    for i in range(count):
+        sender.send_bytes(pickle.dumps({'index': i, 'message': 'x' * (i % 100)}))
+    sender.send_bytes(pickle.dumps({'message': 'y' * 100000}))
+
+
+class ChannelTests(unittest.TestCase):
+    def receive(self, receiver, buffer):
+        self.assertTrue(receiver.poll(10.0))
+        try:
+            size = receiver.recv_bytes_into(buffer)
+            return pickle.loads(buffer[:size]), buffer
+        except multiprocessing.BufferTooShort as e:
+            return pickle.loads(e.args[0]), bytearray(len(e.args[0]))
+
+    def test_messages_delivered_in_order(self):
+        receiver, sender = open_channel(ring_size=4096)
+        process = multiprocessing.Process(target=_send_messages, args=(sender, 1000))
+        process.start()
+
+        buffer = bytearray(64)
+        for i in range(1000):
+            message, buffer = self.receive(receiver, buffer)
+            self.assertEqual(i, message['index'])
+
+        # Messages larger than both the ring and the receive buffer must still come through intact.
+        message, buffer = self.receive(receiver, buffer)
+        self.assertEqual('y' * 100000, message['message'])
+
+        process.join(10.0)
+        receiver.close()
+
+    @unittest.skipUnless(os.name == 'posix', 'requires fork()')
+    def test_pipe_channel(self):
+        channel = PipeChannel()
+        process = multiprocessing.get_context('fork').Process(target=_send_messages, args=(channel, 1000))
+        process.start()
+
+        buffer = bytearray(64)
+        for i in range(1000):
+            message, buffer = self.receive(channel, buffer)
+            self.assertEqual(i, message['index'])
+
+        message, buffer = self.receive(channel, buffer)
+        self.assertEqual('y' * 100000, message['message'])
+        self.assertFalse(channel.poll())
+
+        process.join(10.0)
+        channel.close()
+
+    def test_poll_without_messages(self):
+        receiver, sender = open_channel()
+
+        self.assertFalse(receiver.poll())
+
+        receiver.close()
+
+    def test_poll_after_writer_killed(self):
+        # A writer killed while blocked on a full ring mustn't leave the reader blocked too.
+        receiver, sender = open_channel(ring_size=4096)
+        process = multiprocessing.Process(target=_send_messages, args=(sender, 1000))
+        process.start()
+        time.sleep(0.5)
+        process.kill()
+        process.join(10.0)
+
+        buffer = bytearray(64)
+        while receiver.poll(1.0):
+            message, buffer = self.receive(receiver, buffer)
+
+        receiver.close()
+
+    def test_local_channel(self):
+        receiver, sender = open_local_channel()
+        thread = threading.Thread(target=_send_messages, args=(sender, 100))
+        thread.start()
+
+        buffer = bytearray(64)
+        for i in range(100):
+            message, buffer = self.receive(receiver, buffer)
+            self.assertEqual(i, message['index'])
+
+        message, buffer = self.receive(receiver, buffer)
+        self.assertEqual('y' * 100000, message['message'])
+        self.assertFalse(receiver.poll())
+
+        thread.join()
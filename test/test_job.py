@@ -0,0 +1,181 @@
+import importlib.util
+import io
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from as_models import log_levels
+from as_models.web_api import _LOG_BATCH_SIZE, _LOG_ENTRIES, _STATE_UPDATE, _ThreadStreamRouter, _UpdateFlusher, \
+    _Updater, _get_stream_router
+
+# Run in a fresh interpreter, so that gevent's monkey-patching doesn't leak into other tests. Exits non-zero if a log
+# entry isn't flushed by a native flusher while the (monkey-patched) main thread computes without yielding.
+GEVENT_FLUSH_SCRIPT = '''
+from gevent import monkey
+monkey.patch_all()
+
+import time
+from as_models.web_api import _Updater, _UpdateFlusher
+
+sent_at = []
+
+class Sender(object):
+    def send_bytes(self, data):
+        sent_at.append(time.monotonic())
+
+updater = _Updater(Sender(), native=True)
+flusher = _UpdateFlusher(updater, native=True)
+flusher.start()
+updater.log('Computing...', level='INFO')
+
+computed_until = time.monotonic() + 1.0
+while time.monotonic() < computed_until:
+    pass
+
+flusher.stop()
+assert sent_at and sent_at[0] < computed_until, 'Log entry not flushed while computing.'
+'''
+
+
+class FakeSender(object):
+    """
+    Records the messages an _Updater sends, as (kind, payload) tuples.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def send_bytes(self, data):
+        self.messages.append((data[:1], pickle.loads(data[1:])))
+
+
+class UpdaterTests(unittest.TestCase):
+    def setUp(self):
+        self.sender = FakeSender()
+        self.updater = _Updater(self.sender)
+
+        # Freeze the clock, so that every progress update falls within the coalescing interval of the last one sent.
+        patcher = mock.patch.object(time, 'monotonic', return_value=1000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_deferred_progress_sent_on_flush(self):
+        self.updater.update(progress=0.5)
+        self.assertEqual([(_STATE_UPDATE, {'state': 'RUNNING', 'progress': 0.5})], self.sender.messages)
+
+        self.updater.update(progress=0.5001)
+        self.updater.update(progress=0.5002)
+        self.assertEqual(1, len(self.sender.messages))
+
+        self.updater.flush()
+        self.assertEqual((_STATE_UPDATE, {'progress': 0.5002}), self.sender.messages[-1])
+
+        # Nothing further is pending.
+        self.updater.flush()
+        self.assertEqual(2, len(self.sender.messages))
+
+    def test_large_progress_change_not_deferred(self):
+        self.updater.update(progress=0.5)
+        self.updater.update(progress=0.6)
+
+        self.assertEqual((_STATE_UPDATE, {'progress': 0.6}), self.sender.messages[-1])
+
+    def test_deferred_progress_piggybacks_on_next_update(self):
+        self.updater.update(progress=0.5)
+        self.updater.update(progress=0.5001)
+        self.updater.update(message='Halfway')
+
+        self.assertEqual((_STATE_UPDATE, {'message': 'Halfway', 'progress': 0.5001}), self.sender.messages[-1])
+
+        self.updater.flush()
+        self.assertEqual(2, len(self.sender.messages))
+
+    def test_logs_sent_in_batches(self):
+        for i in range(_LOG_BATCH_SIZE - 1):
+            self.updater.log('Message {}'.format(i), level=log_levels.INFO)
+        self.assertEqual([], self.sender.messages)
+
+        self.updater.log('Message {}'.format(_LOG_BATCH_SIZE - 1), level=log_levels.INFO)
+        self.assertEqual(1, len(self.sender.messages))
+
+        kind, entries = self.sender.messages[0]
+        self.assertEqual(_LOG_ENTRIES, kind)
+        self.assertEqual(['Message {}'.format(i) for i in range(_LOG_BATCH_SIZE)], [e['message'] for e in entries])
+
+    def test_logs_sent_before_state_update(self):
+        self.updater.log('Starting', level=log_levels.INFO)
+        self.updater.update(message='Started')
+
+        self.assertEqual([_LOG_ENTRIES, _STATE_UPDATE], [kind for kind, _ in self.sender.messages])
+
+    def test_entries_below_log_level_dropped(self):
+        self.updater.set_log_level(logging.INFO)
+
+        for level in (log_levels.DEBUG, log_levels.INFO, log_levels.STDOUT, log_levels.STDERR):
+            self.updater.log(level, level=level)
+        self.updater.flush()
+
+        entries = [entry for kind, batch in self.sender.messages if kind == _LOG_ENTRIES for entry in batch]
+        self.assertEqual([log_levels.INFO, log_levels.STDOUT, log_levels.STDERR], [e['level'] for e in entries])
+
+
+class UpdateFlusherTests(unittest.TestCase):
+    def test_flushes_periodically(self):
+        for native in (False, True):
+            sender = FakeSender()
+            updater = _Updater(sender, native=native)
+            flusher = _UpdateFlusher(updater, native=native)
+            flusher.start()
+
+            updater.log('Message', level=log_levels.INFO)
+            time.sleep(0.5)
+            self.assertEqual(1, len(sender.messages))
+
+            flusher.stop()
+
+    @unittest.skipIf(importlib.util.find_spec('gevent') is None, 'requires gevent')
+    def test_flushes_while_computing_under_gevent(self):
+        result = subprocess.run([sys.executable, '-c', GEVENT_FLUSH_SCRIPT], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.dirname(__file__)), timeout=60)
+
+        self.assertEqual(0, result.returncode, result.stdout.decode('utf-8', 'replace'))
+
+
+class StreamRoutingTests(unittest.TestCase):
+    def test_only_the_job_thread_is_redirected(self):
+        original, job_output = io.StringIO(), io.StringIO()
+        router = _ThreadStreamRouter(original)
+
+        def job():
+            router.redirect(job_output)
+            router.write('job')
+            router.restore()
+            router.write(' after job')
+
+        router.write('host')
+        thread = threading.Thread(target=job)
+        thread.start()
+        thread.join()
+        router.write(' still host')
+
+        self.assertEqual('job', job_output.getvalue())
+        self.assertEqual('host after job still host', original.getvalue())
+
+    def test_router_installed_once(self):
+        original = io.StringIO()
+        with mock.patch.object(sys, 'stdout', original):
+            router = _get_stream_router('stdout')
+
+            self.assertIs(router, sys.stdout)
+            self.assertIs(original, router.original_stream)
+            self.assertIs(router, _get_stream_router('stdout'))
+
+
+if __name__ == '__main__':
+    unittest.main()
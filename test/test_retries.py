@@ -13,6 +13,7 @@ import httpretty
 import requests
 from requests.adapters import HTTPAdapter
 import unittest
+from unittest import mock
 from webob import Request
 from webob.exc import HTTPError as WebObHTTPError
 
@@ -28,10 +29,37 @@ def _webob_raise_for_status(response):
         )
 
 
+class VirtualClock:
+    """
+    Stands in for time.sleep() and datetime.now(), so that backoff periods are recorded rather than waited out.
+    """
+
+    def __init__(self):
+        self.offset = timedelta()
+        self.sleeps = []
+
+        clock = self
+
+        class _VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now(tz)
+
+        self.datetime = _VirtualDatetime
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.offset += timedelta(seconds=seconds)
+
+    def now(self, tz=None):
+        return datetime.now(tz) + self.offset
+
+
 class MockJsonResource:
     def __init__(self, url, responses_=None):
         self._url = url
         self._responses = [] if responses_ is None else responses_
+        self._served = 0
 
         httpretty.register_uri(httpretty.GET, url, body=self)
 
@@ -43,17 +71,21 @@ class MockJsonResource:
         self._responses.append((status, headers, body_))
         return status, headers, body
 
+    def reset(self):
+        self._responses.clear()
+        self._served = 0
+
     @property
     def url(self):
         return self._url
 
     @property
     def request_count(self):
-        return len(httpretty.latest_requests())
+        return self._served
 
     def __call__(self, request, uri, response_headers):
-
-        response = self._responses[self.request_count - 1]
+        response = self._responses[self._served]
+        self._served += 1
 
         if inspect.isclass(response[2]) and issubclass(response[2], BaseException):
             raise response[2]('mock exception')
@@ -61,7 +93,18 @@ class MockJsonResource:
         return response
 
 
-class RetriesTests(unittest.TestCase):
+class VirtualClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+
+        for target, replacement in (('time.sleep', self.clock.sleep),
+                                    ('as_models.api_support.retries.datetime', self.clock.datetime)):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class RetriesTests(VirtualClockTestCase):
     RETRY_STRATEGY = Retry(
         total=9,
         status_forcelist=[429, 500, 502, 503, 504],
@@ -70,9 +113,23 @@ class RetriesTests(unittest.TestCase):
     )
     HTTP_ADAPTER = HTTPAdapter(max_retries=RETRY_STRATEGY)
 
-    @httpretty.activate
+    # NOTE: httpretty is enabled (and the mock resource registered) once for the whole class, rather than per test.
+    @classmethod
+    def setUpClass(cls):
+        httpretty.enable()
+        cls.resource = MockJsonResource('http://senaps.io/api/test')
+
+    @classmethod
+    def tearDownClass(cls):
+        httpretty.disable()
+        httpretty.reset()
+
+    def tearDown(self):
+        self.resource.reset()
+        httpretty.latest_requests().clear()
+
     def test_retry_decorator_connection_error(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(None, None, ConnectionResetError)
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -87,7 +144,6 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_retry_decorator_sensor_client_error(self):
 
         def make_request():
@@ -101,9 +157,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(retryable._request_count, 3)
 
 
-    @httpretty.activate
     def test_retry_decorator_when_rate_limited(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(429, {'Retry-After': '1'}, {'status': 'rate limited'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -118,9 +173,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_exceeding_retry_limit_with_decorator(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(429, {'Retry-After': '1'}, {'status': 'rate limited'})
         expected_status, _, expected_body = resource.add_response(429, {'Retry-After': '1'}, {'status': 'rate limited'})
         resource.add_response(200, {}, {'status': 'succeeded'})
@@ -139,9 +193,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_retry_adapter_connection_error(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(None, None, ConnectionResetError)
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -154,9 +207,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_http_adapter_when_rate_limited(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(429, {'Retry-After': '1'}, {'status': 'rate limited'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -169,9 +221,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_retry_decorator_connection_error_with_webob(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(None, None, ConnectionResetError)
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -188,9 +239,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(2, resource.request_count)
 
 
-    @httpretty.activate
     def test_decorator_with_webob(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(429, {'Retry-After': '1'}, {'status': 'rate limited'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -206,9 +256,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, json.loads(response.text))
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_http_adapter_when_server_error(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(500, {}, {'status': 'server error'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -221,9 +270,8 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_server_error_with_webob(self):
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(500, {}, {'status': 'server error'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -239,14 +287,13 @@ class RetriesTests(unittest.TestCase):
         self.assertEqual(expected_body, json.loads(response.text))
         self.assertEqual(2, resource.request_count)
 
-    @httpretty.activate
     def test_parsing_timestamp_based_retry_header(self):
         # Request no retries until three seconds from now.
         now = datetime.now(GMT)
         retry_after = (now + timedelta(seconds=3)).replace(microsecond=0)
         header_value = retry_after.strftime(RFC_7231_TIMESTAMP_FORMAT)
 
-        resource = MockJsonResource('http://senaps.io/api/test')
+        resource = self.resource
         resource.add_response(429, {'Retry-After': header_value}, {'status': 'rate limited'})
         expected_status, _, expected_body = resource.add_response(200, {}, {'status': 'succeeded'})
 
@@ -259,13 +306,15 @@ class RetriesTests(unittest.TestCase):
         response = make_request()
 
         # Current time MUST be after the retry_after timestamp.
-        now = datetime.now(GMT)
-        self.assertTrue(now >= retry_after)
+        self.assertTrue(self.clock.now(GMT) >= retry_after)
+        self.assertAlmostEqual(3.0, self.clock.sleeps[0], delta=1.0)
 
         self.assertEqual(expected_status, response.status_code)
         self.assertEqual(expected_body, response.json())
         self.assertEqual(2, resource.request_count)
 
+
+class ConnectionRetriesTests(VirtualClockTestCase):
     def test_connect_timeout_retry(self):
         attempts = 0
 
@@ -61,6 +61,20 @@ class TestTesting(unittest.TestCase):
         self.context.ports['doc[]'][0].value = 'new_value'
         self.assertEqual(self.context.ports['doc[]'][0].value, 'new_value')
 
+    def test_update_modified_streams(self):
+        streams = ['s1']
+        self.context.update(modified_streams=streams)
+        self.context.update(modified_streams=streams)
+
+        # Mutating the same list between calls must still be picked up.
+        streams.append('s2')
+        self.context.update(modified_streams=streams)
+        self.context.update(modified_streams=['s3'])
+        self.context.update(progress=0.5)
+
+        self.assertEqual({'s1', 's2', 's3'}, self.context.modified_streams)
+        self.assertEqual({}, self.context.modified_documents)
+
     def test_doc_collection_inner_ports_should_be_singular_type(self):
         self.context.configure_port("doc[]_org", DOCUMENT_COLLECTION_PORT, INPUT_PORT, values=["abc1", "abc2"],
                                     doc_organisation_id="test_org")
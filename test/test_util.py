@@ -4,7 +4,8 @@ import unittest
 
 from six import string_types
 
-from as_models.util import sanitize_dict_for_json
+from as_models.constants import MAX_ERR_DATA_LEN
+from as_models.util import maybe_sanitize_dict_for_json, sanitize_dict_for_json
 
 
 class TestJsonUtils(unittest.TestCase):
@@ -56,3 +57,16 @@ class TestJsonUtils(unittest.TestCase):
         # all values should now be strings, no datetimes.
         # using six string_types here for 2/3 compatibility
         self.assertTrue(all([isinstance(x, string_types) for x in sanitized.values()]), [type(x) for x in sanitized.values()])
+
+    def test_maybe_sanitize_returns_flat_json_dict_unchanged(self):
+        valid = {'name': 'a model descriptor', 'count': 3, 'pi_field': 3.14, 'truthy': True, 'None': None}
+        self.assertIs(valid, maybe_sanitize_dict_for_json(valid))
+        self.assertIsNone(maybe_sanitize_dict_for_json(None))
+
+    def test_maybe_sanitize_falls_back_to_sanitize(self):
+        dt_now = datetime.datetime.now()
+        nested = {'data': [1, 2, 3], 'now': dt_now}
+        self.assertDictEqual(sanitize_dict_for_json(nested), maybe_sanitize_dict_for_json(nested))
+
+        too_large = {'blob': 'x' * MAX_ERR_DATA_LEN}
+        self.assertIn('error', maybe_sanitize_dict_for_json(too_large))
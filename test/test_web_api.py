@@ -1,5 +1,8 @@
 
+import collections
+import functools
 import json
+import threading
 import time
 
 from as_models.manifest import Manifest
@@ -8,7 +11,7 @@ from as_models.web_api import _load_runtime
 import os
 import unittest
 
-from as_models.web_api import app
+from as_models.web_api import api_state, app
 
 from as_models.testing.mock import MockAnalysisServiceApi
 
@@ -17,112 +20,163 @@ from rpy2.robjects import r, conversion
 from rpy2.rinterface import NULL
 from rpy2.robjects.vectors import ListVector
 
+# How long to wait for a model to finish before falling back to polling it.
+WAIT_TIMEOUT_SEC = 30.0
+
+# Terms expected in (and absent from) the warning about a job's missing required port bindings. NOTE: in1 is bound, so
+# shouldn't be reported on.
+MISSING_PORTS_REQUIRED_TERMS = ('Missing', 'required', 'port', 'out1')
+MISSING_PORTS_FORBIDDEN_TERMS = ('in1',)
+
+# Delay between polls of a running model.
+POLL_INTERVAL_SEC = 0.01
+
+# Model logs are only printed when TEST_VERBOSE is set, as formatting them is expensive for chatty models.
+VERBOSE = bool(os.environ.get('TEST_VERBOSE'))
+
+DEFAULT_START_BODY = json.dumps({
+    'modelId': 'test_model',
+    'ports': {
+        'input': { 'document': 'test_document' },
+        'output': { 'document': 'placeholder' }
+    }
+}).encode('utf-8')
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# Immutable, so that a single (cached) instance can safely be shared between tests.
+ModelResources = collections.namedtuple('ModelResources', 'model_path manifest_path entrypoint_path manifest')
+
+@functools.lru_cache(maxsize=None)
 def get_model_path(lang='python'):
     if lang == 'python':
-        test_model_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_model')
-        test_model_manifest_path = os.path.join(test_model_dir, 'manifest.json')
+        test_model_dir = os.path.join(TEST_DIR, 'test_model')
         test_model_entrypoint_path = os.path.join(test_model_dir, 'model.py')
-        test_model_manifest = Manifest.from_file(os.path.join(test_model_dir, 'manifest.json'))
     else:
-        test_model_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'r_test_model')
-        test_model_manifest_path = os.path.join(test_model_dir, 'manifest.json')
+        test_model_dir = os.path.join(TEST_DIR, 'r_test_model')
         test_model_entrypoint_path = os.path.join(test_model_dir, 'model.R')
-        test_model_manifest = Manifest.from_file(os.path.join(test_model_dir, 'manifest.json'))
-
-    return {
-        'model_path': test_model_dir,
-        'manifest_path': test_model_manifest_path,
-        'entrypoint_path': test_model_entrypoint_path,
-        'manifest': test_model_manifest
-    }
-
-def host_model(model_path, port):
-    # sys.stdout = open('{}.out'.format(port), 'w')
-    # sys.stderr = open('{}.err'.format(port), 'w')
-    
-    app.config['model_path'] = model_path
+    test_model_manifest_path = os.path.join(test_model_dir, 'manifest.json')
 
-    return app.test_client()
+    return ModelResources(
+        model_path=test_model_dir,
+        manifest_path=test_model_manifest_path,
+        entrypoint_path=test_model_entrypoint_path,
+        manifest=Manifest.from_file(test_model_manifest_path)
+    )
 
 class TestModelClient(object):
-    def __init__(self, port, test_client):
+    def __init__(self, test_client):
         self._test_client = test_client
     
     def start(self, payload=None): # TODO: model params
+        if not payload:
+            return self._test_client.post(data=DEFAULT_START_BODY, content_type='application/json').json
 
-        p = payload or {
-            'modelId': 'test_model',
-            'ports': {
-                'input': { 'document': 'test_document' },
-                'output': { 'document': 'placeholder' }
-            }
-        }
-
-        return self._test_client.post(json=p).json
+        return self._test_client.post(json=payload).json
 
     def poll(self):
         return self._test_client.get().json
 
+    def wait(self, timeout):
+        return self._test_client.get("wait", query_string={'timeout': timeout}).json
+
     def terminate(self, timeout):
         return self._test_client.post("terminate", json={'timeout': timeout}).json
 
 
 class TestModel(object):
-    def __init__(self, port, lang='python'):
-        self._port = port
-        self._proc = None
-        self._model_path = get_model_path(lang)['model_path']
+    def __init__(self, test_client, lang='python', in_process=False):
+        self._test_client = test_client
+        self._model_path = get_model_path(lang).model_path
+        self._in_process = in_process
 
     def __enter__(self):
-        self._test_client = host_model(self._model_path, self._port)
-        self._test_client.__enter__()
-        return TestModelClient(self._port, self._test_client)
+        # The web API only runs one job over its lifetime, refusing further requests once a job process has been set,
+        # so start each model from a fresh state.
+        api_state.reset()
+        app.config['model_path'] = self._model_path
+        app.config['args'] = {'in_process': self._in_process}
+
+        return TestModelClient(self._test_client)
     
     def __exit__(self, *args):
-        self._test_client.__exit__(None, None, None)
+        pass
+
+# A single test client is shared by all tests in the module. TestModel resets the web API's state before each model is
+# run, so there's no need for a fresh client per test.
+test_client = None
+
+def setUpModule():
+    global test_client
+    test_client = app.test_client()
+    test_client.__enter__()
+
+def tearDownModule():
+    test_client.__exit__(None, None, None)
 
 class RuntimeTests(unittest.TestCase):
     def test_load_from_directory(self):
         resources = get_model_path()
 
-        runtime = _load_runtime(resources['model_path'])
+        runtime = _load_runtime(resources.model_path)
         
-        self.assertEqual(runtime.manifest, resources['manifest'])
-        self.assertEqual(runtime.entrypoint_path, resources['entrypoint_path'])
+        self.assertEqual(runtime.manifest, resources.manifest)
+        self.assertEqual(runtime.entrypoint_path, resources.entrypoint_path)
     
     def test_load_from_manifest(self):
         resources = get_model_path()
 
-        runtime = _load_runtime(resources['manifest_path'])
+        runtime = _load_runtime(resources.manifest_path)
         
-        self.assertEqual(runtime.manifest, resources['manifest'])
-        self.assertEqual(runtime.entrypoint_path, resources['entrypoint_path'])
+        self.assertEqual(runtime.manifest, resources.manifest)
+        self.assertEqual(runtime.entrypoint_path, resources.entrypoint_path)
     
     def test_load_from_entrypoint(self):
         resources = get_model_path()
 
-        runtime = _load_runtime(resources['entrypoint_path'])
+        runtime = _load_runtime(resources.entrypoint_path)
         
-        self.assertEqual(runtime.manifest, resources['manifest'])
-        self.assertEqual(runtime.entrypoint_path, resources['entrypoint_path'])
+        self.assertEqual(runtime.manifest, resources.manifest)
+        self.assertEqual(runtime.entrypoint_path, resources.entrypoint_path)
 
 
 class HostTests(unittest.TestCase):
     mock_as = MockAnalysisServiceApi()
 
-    def test_hosting_test_model(self):
+    ALL_PORT_TYPES_JOB = {
+        "modelId": "all_port_types_model",
+        "ports": {
+            "input_documents": {"ports": [{"documentId": "indoc1"}, {"documentId": "indoc2"}]},
+            "input_streams": {"ports": [{"streamId": "s1"}, {"streamId": "s2"}]},
+            "output_documents": {"ports": [{"documentId": "outdoc1"}, {"documentId": "outdoc2"}]},
+            "input_document": {"documentId": "indoc3"},
+            "output_document": {"documentId": "outdoc3"}
+        }
+    }
 
-        for lang in ['r', 'python']:
-            self.run_model(lang)
+    @classmethod
+    def setUpClass(cls):
+        # Initialise the R interpreter up front, rather than in whichever R test happens to run first.
+        r('1+1')
+
+    def test_python_hosting_test_model(self):
+        self.run_model('python')
+
+    def test_r_hosting_test_model(self):
+        self.run_model('r')
 
     @mock_as.activate
     def run_model(self, lang='python', payload_json=None, callback=None):
         print('--- Executing Test (lang=%s) ---' % lang)
 
         if payload_json is not None:
-            payload_json.setdefault('analysisServicesConfiguration', {})['url'] = HostTests.mock_as.base_url
+            # NOTE: copied, as payloads may be shared between tests.
+            payload_json = dict(payload_json, analysisServicesConfiguration=dict(
+                payload_json.get('analysisServicesConfiguration', {}), url=HostTests.mock_as.base_url))
 
-        with TestModel(8000, lang) as model:
+        # Python models are run on a thread of the test process, skipping the cost of starting a subprocess. R models
+        # still get a subprocess, to isolate the R interpreter.
+        with TestModel(test_client, lang, in_process=(lang == 'python')) as model:
             # Send job start request.
             response = model.start(payload_json)
             self.handle_response(callback, response)
@@ -130,8 +184,12 @@ class HostTests(unittest.TestCase):
             if 'state' not in response:
                 raise KeyError("state not found in response: " + str(response))
 
-            # Poll for model completion.
+            # Wait for model completion, falling back to polling if the wait times out.
+            response = model.wait(WAIT_TIMEOUT_SEC)
+            self.handle_response(callback, response)
+
             while response['state'] not in ('COMPLETE', 'FAILED'):
+                time.sleep(POLL_INTERVAL_SEC)
                 response = model.poll()
                 self.handle_response(callback, response)
 
@@ -155,14 +213,23 @@ class HostTests(unittest.TestCase):
 
         return response, HostTests.mock_as.documents
 
+    def run_model_collecting_logs(self, lang, payload_json):
+        logs = []
+
+        def callback(res):
+            logs.extend(res.get('log', []))
+
+        response, _ = self.run_model(lang, payload_json, callback)
+        return response, logs
+
     def handle_response(self, callback, response):
         self.print_logs(response)
         if callback:
             callback(response)
 
     def print_logs(self, response):
-        if 'log' in response and len(response['log']) > 0:
-            print(json.dumps(response['log'], indent=4, sort_keys=True))
+        if VERBOSE and response.get('log'):
+            print(json.dumps(response['log']))
 
     def test_all_port_types_model_r(self):
         HostTests.mock_as.set_document('indoc1', 'foo', 'csiro')
@@ -172,16 +239,7 @@ class HostTests(unittest.TestCase):
         HostTests.mock_as.set_document('outdoc2', 'bar bar', 'csiro')
         HostTests.mock_as.set_document('outdoc3', 'single output', 'csiro')
 
-        _, documents = self.run_model('r', {
-                "modelId": "all_port_types_model",
-                "ports": {
-                    "input_documents": {"ports": [{"documentId": "indoc1"}, {"documentId": "indoc2"}]},
-                    "input_streams": {"ports": [{"streamId": "s1"}, {"streamId": "s2"}]},
-                    "output_documents": {"ports": [{"documentId": "outdoc1"}, {"documentId": "outdoc2"}]},
-                    "input_document": {"documentId": "indoc3"},
-                    "output_document": {"documentId": "outdoc3"}
-                }
-            })
+        _, documents = self.run_model('r', HostTests.ALL_PORT_TYPES_JOB)
 
         self.assertEqual('single input updated', documents['outdoc3']['value'])
 
@@ -197,16 +255,7 @@ class HostTests(unittest.TestCase):
         HostTests.mock_as.set_document('outdoc2', 'bar bar', 'csiro')
         HostTests.mock_as.set_document('outdoc3', 'single output', 'csiro')
 
-        response, documents = self.run_model('python', {
-            "modelId": "all_port_types_model",
-            "ports": {
-                "input_documents": {"ports": [{"documentId": "indoc1"}, {"documentId": "indoc2"}]},
-                "input_streams": {"ports": [{"streamId": "s1"}, {"streamId": "s2"}]},
-                "output_documents": {"ports": [{"documentId": "outdoc1"}, {"documentId": "outdoc2"}]},
-                "input_document": {"documentId": "indoc3"},
-                "output_document": {"documentId": "outdoc3"}
-            }
-        })
+        response, documents = self.run_model('python', HostTests.ALL_PORT_TYPES_JOB)
 
         self.assertEqual('single input updated', documents['outdoc3']['value'])
         self.assertEqual('foo 0', documents['outdoc1']['value'])
@@ -219,30 +268,25 @@ class HostTests(unittest.TestCase):
         self._test_missing_required_ports_should_warn_not_fail('r')
 
     def _test_missing_required_ports_should_warn_not_fail(self, lang):
-        self._all_logs = []
-
-        def callback(res):
-            self._all_logs = self._all_logs + res.get('log', [])
-
         HostTests.mock_as.set_document('indoc1', 'assigned value ok', 'csiro')
 
-        self.run_model(lang, {
+        _, logs = self.run_model_collecting_logs(lang, {
             'modelId': 'required_ports_model_in1_out1',
             'ports': {
                 'in1': {'documentId': 'indoc1'}
                 # out1 is the missing port and should warn but not fail...
             }
-        }, callback)
+        })
 
-        first_log_message = self._all_logs[0]['message']
+        first_log_message = logs[0]['message']
 
-        for term in ['Missing', 'required', 'port', 'out1']:
-            self.assertIn(term, first_log_message)
+        missing = [term for term in MISSING_PORTS_REQUIRED_TERMS if term not in first_log_message]
+        self.assertFalse(missing, 'Terms {} not found in "{}"'.format(missing, first_log_message))
 
-        for term in ['in1']:  # in1 is fine, shouldn't be reported on...
-            self.assertNotIn(term, first_log_message)
+        unexpected = [term for term in MISSING_PORTS_FORBIDDEN_TERMS if term in first_log_message]
+        self.assertFalse(unexpected, 'Terms {} found in "{}"'.format(unexpected, first_log_message))
 
-        self.assertEqual('WARNING', self._all_logs[0]['level'])
+        self.assertEqual('WARNING', logs[0]['level'])
 
     def test_python_log_flushes_per_request(self):
         self._test_log_flushes_per_request('python')
@@ -251,14 +295,14 @@ class HostTests(unittest.TestCase):
         self._test_log_flushes_per_request('r')
 
     def _test_log_flushes_per_request(self, lang):
-        self._all_logs = []
+        seen_logs = set()
 
         def callback(res):
             # confirm each log entry is new
             for log in res.get('log', []):
-                self.assertTrue(log not in self._all_logs, json.dumps(log) + " found in " + json.dumps(self._all_logs))
-            # combine logs
-            self._all_logs = self._all_logs + res.get('log', [])
+                key = tuple(sorted(log.items()))
+                self.assertNotIn(key, seen_logs, json.dumps(log) + " already reported")
+                seen_logs.add(key)
 
         self.run_model(lang, {
             'modelId': 'all_port_types_model',
@@ -271,17 +315,11 @@ class HostTests(unittest.TestCase):
     def test_r_errors_are_caught_and_reported(self):
         self._test_errors_are_caught_and_reported('r')
 
-    def _test_errors_are_caught_and_reported(self, lang):
-        self._all_logs = []
-
-        def callback(res):
-            # HACK: combine logs. interpreter will find the right variable here.
-            self._all_logs = self._all_logs + res.get('log', [])
-
-        response, _ = self.run_model(lang, {
-            'modelId': 'test_error',
+    def _test_errors_are_caught_and_reported(self, lang, model_id='test_error'):
+        response, logs = self.run_model_collecting_logs(lang, {
+            'modelId': model_id,
             'ports': {}
-        }, callback)
+        })
 
         exception = response.get('exception')
         self.assertIsNotNone(exception)
@@ -291,39 +329,44 @@ class HostTests(unittest.TestCase):
         self.assertTrue('something went wrong' in exception['developer_msg'])
 
         self.assertTrue(any(
-            (log['level'] == 'CRITICAL') and ('something went wrong' in log['message']) for log in self._all_logs
+            (log['level'] == 'CRITICAL') and ('something went wrong' in log['message']) for log in logs
         ), 'Expecting CRITICAL log message.')
 
-    def test_large_json_string_is_reported(self):
-        for lang in ['python']:
-            # NB: no test for R, we do not support exposing the user_data via R yet.
-            self._all_logs = []
+    def test_python_large_json_string_is_reported(self):
+        # NB: no test for R, we do not support exposing the user_data via R yet.
+        self._test_errors_are_caught_and_reported('python', 'test_error_too_large')
 
-            def callback(res):
-                # HACK: combine logs. interpreter will find the right variable here.
-                self._all_logs = self._all_logs + res.get('log', [])
 
-            response, _ = self.run_model(lang, {
-                'modelId': 'test_error_too_large',
-                'ports': {}
-            }, callback)
+class EdgeCaseTests(unittest.TestCase):
+    def test_health_check(self):
+        response = test_client.get('/healthz')
 
-            exception = response.get('exception')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'ok', response.data)
 
-            self.assertIsNotNone(exception)
+    def test_job_forked_while_state_locked_can_log(self):
+        # Hold the API state's lock while the job is started (and forked), as a concurrent status request might.
+        locked = threading.Event()
 
-            self.assertTrue('something went wrong' in exception['msg'])
-            self.assertTrue('Traceback' in exception['developer_msg'])
-            self.assertTrue('something went wrong' in exception['developer_msg'])
+        def hold_lock():
+            with api_state.lock:
+                locked.set()
+                time.sleep(1.0)
 
-            self.assertTrue(any(
-                (log['level'] == 'CRITICAL') and ('something went wrong' in log['message']) for log in self._all_logs
-            ), 'Expecting CRITICAL log message.')
+        with TestModel(test_client) as model:
+            thread = threading.Thread(target=hold_lock)
+            thread.start()
+            locked.wait()
+            model.start({'modelId': 'test_error'})
+            thread.join()
 
+            # The job logs a CRITICAL message before reporting its failure, so would never fail if logging blocked.
+            response = model.wait(WAIT_TIMEOUT_SEC)
+            model.terminate(0.0)
+            self.assertEqual('FAILED', response['state'])
 
-class EdgeCaseTests(unittest.TestCase):
     def test_slow_poll_does_not_cause_abnormal_termination_error(self):
-        with TestModel(8000, 'python') as model:
+        with TestModel(test_client) as model:
             messages = []
 
             # Send job start request.